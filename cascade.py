@@ -1,12 +1,17 @@
 """
 Main cascading API client for reliable AI API access
 """
+import base64
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from typing import List, Dict, Optional
 
 try:
     from openai import OpenAI
     import openai
+    import httpx
 except ImportError:
     print("OpenAI package not found. Install with: pip install openai")
     exit(1)
@@ -17,38 +22,93 @@ try:
 except ImportError:
     print("Note: python-dotenv not found. Using system environment variables.")
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from cassette import Cassette, CassetteMiss, RECORD, REPLAY
 from config import settings
+from health import ProviderHealth
+from prober import HealthProber
 from providers import ProviderConfig, get_available_providers
+from scheduler import AdmissionScheduler, AdmissionRejected, PRIORITY_INTERACTIVE
 from usage_tracker import UsageTracker
-from utils import setup_logging, exponential_backoff, adapt_request_params
+from utils import setup_logging, exponential_backoff, adapt_request_params, estimate_tokens
 
 # Setup logging
 setup_logging()
 logger = logging.getLogger(__name__)
 
+@dataclass
+class Attempt:
+    """Outcome of one provider attempt within a call"""
+    provider: str
+    outcome: str
+    elapsed: float = 0.0
+    error: str = ""
+
+    def __str__(self) -> str:
+        text = f"{self.provider}: {self.outcome} after {self.elapsed:.2f}s"
+        return f"{text} ({self.error})" if self.error else text
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call's time budget runs out before any provider succeeds"""
+
+    def __init__(self, message: str, attempts: List[Attempt]):
+        self.attempts = attempts
+        summary = "; ".join(str(a) for a in attempts) or "no attempts made"
+        super().__init__(f"{message}: {summary}")
+
 class CascadingAPIClient:
     """Main cascading API client with automatic provider fallback"""
 
-    def __init__(self, providers: List[ProviderConfig] = None):
+    def __init__(self, providers: List[ProviderConfig] = None, cassette: Cassette = None,
+                 health_probe: bool = None):
         """
         Initialize the cascading API client
 
         Args:
-            providers: List of provider configurations. If None, uses all available providers.
+            providers: List of provider configurations. If None, uses all available providers
+                (or, when replaying, the providers stored in the cassette).
+            cassette: Optional cassette to record provider traffic to or replay it from
+            health_probe: Validate keys at startup and keep probing providers in the background
+                (defaults to settings)
         """
-        self.providers = providers or get_available_providers()
-        self.usage_tracker = UsageTracker()
+        self.cassette = cassette
+        # Replays compress the cascade's own waits by the same factor as recorded latency
+        self.time_scale = cassette.time_scale if cassette is not None else 1.0
+        if cassette is not None and cassette.mode == REPLAY:
+            self.providers = providers or cassette.providers()
+            # Replays must not consume or depend on the real daily quota file
+            self.usage_tracker = UsageTracker(persist=False)
+        else:
+            self.providers = providers or get_available_providers()
+            self.usage_tracker = UsageTracker()
         self.clients = {}
 
         if not self.providers:
             raise ValueError("No API providers available. Please set up your API keys.")
 
+        self.scheduler = AdmissionScheduler(self.providers, time_scale=self.time_scale)
+        self.health = ProviderHealth()
+
+        if cassette is not None and cassette.mode == RECORD:
+            cassette.register_providers(self.providers)
+
         # Initialize OpenAI clients for each provider
         for provider in self.providers:
             try:
+                client_options = {}
+                if cassette is not None:
+                    client_options["http_client"] = httpx.Client(transport=cassette.transport())
+                    # Every retry goes through the cascade, so it is recorded and replayed one to one
+                    # and a replay miss surfaces at once instead of being retried with real sleeps
+                    client_options["max_retries"] = 0
                 self.clients[provider.name] = OpenAI(
                     base_url=provider.base_url,
-                    api_key=provider.api_key
+                    api_key=provider.api_key,
+                    **client_options
                 )
                 logger.debug(f"Initialized client for {provider.name}")
             except Exception as e:
@@ -56,17 +116,47 @@ class CascadingAPIClient:
 
         logger.info(f"Initialized cascading client with {len(self.providers)} providers")
 
-    def _make_request(self, provider: ProviderConfig, messages: List[Dict], **kwargs) -> Optional[str]:
-        """Make a request to a specific provider"""
+        self.prober = None
+        if health_probe is None:
+            health_probe = settings.HEALTH_PROBE
+        if health_probe:
+            self.start_health_prober()
+
+    def _key_rejected(self, provider: ProviderConfig, error: Exception):
+        """Handle a rejected API key seen in live traffic"""
+        logger.error(f"[ERROR] API key rejected by {provider.name}: {error}")
+        # Only the prober can mark a provider up again, so without one a single rejection
+        # (e.g. a transient 403) must not take the provider out for good
+        if self.prober is not None and self.prober.is_running:
+            self.health.mark_down(provider.name, f"invalid API key: {error}")
+
+    def _raise_cassette_miss(self, provider: ProviderConfig, error: Exception):
+        """Re-raise a replay miss that the SDK wrapped as a connection error"""
+        if isinstance(error.__cause__, CassetteMiss):
+            self.usage_tracker.release_request(provider.name)
+            raise error.__cause__
+
+    def _make_request(self, provider: ProviderConfig, messages: List[Dict], timeout: float = None,
+                      attempts: List[Attempt] = None, **kwargs) -> Optional[str]:
+        """Make a request to a specific provider, optionally bounded by an HTTP timeout"""
+        if attempts is None:
+            attempts = []
+
         if provider.name not in self.clients:
             logger.error(f"No client available for {provider.name}")
+            attempts.append(Attempt(provider.name, "failed", error="no client available"))
             return None
 
-        if not self.usage_tracker.check_limits(provider):
+        if not self.usage_tracker.reserve_request(provider):
+            attempts.append(Attempt(provider.name, "skipped", error="usage limit reached"))
             return None
 
         client = self.clients[provider.name]
+        if timeout is not None:
+            # The call's budget already accounts for retries, so the SDK must not add its own
+            client = client.with_options(timeout=timeout, max_retries=0)
 
+        start = time.perf_counter()
         try:
             # Prepare request parameters
             request_params = {
@@ -82,58 +172,385 @@ class CascadingAPIClient:
 
             # Make the API call
             response = client.chat.completions.create(**request_params)
+            elapsed = time.perf_counter() - start
+            completion_tokens = response.usage.completion_tokens if response.usage else 1
+            self.health.observe_latency(provider.name, elapsed, tokens=completion_tokens)
 
-            # Update usage tracking
+            # Update usage tracking (the request itself was counted when it was reserved)
             tokens_used = response.usage.total_tokens if response.usage else 0
-            self.usage_tracker.update_usage(provider.name, requests=1, tokens=tokens_used)
+            self.usage_tracker.update_usage(provider.name, tokens=tokens_used)
 
             logger.info(f"[OK] Success with {provider.name} - Tokens used: {tokens_used}")
+            self.health.mark_up(provider.name)
+            attempts.append(Attempt(provider.name, "ok", elapsed))
             return response.choices[0].message.content
 
+        except (openai.AuthenticationError, openai.PermissionDeniedError) as e:
+            self._key_rejected(provider, e)
+            error = str(e)
+        except openai.APIConnectionError as e:
+            self._raise_cassette_miss(provider, e)
+            logger.error(f"[ERROR] API error with {provider.name}: {e}")
+            error = str(e)
         except openai.RateLimitError as e:
             logger.warning(f"[WARN] Rate limit hit for {provider.name}: {e}")
-            return None
+            error = f"rate limit: {e}"
         except openai.APIError as e:
             logger.error(f"[ERROR] API error with {provider.name}: {e}")
-            return None
+            error = str(e)
         except Exception as e:
             logger.error(f"[FATAL] Unexpected error with {provider.name}: {e}")
-            return None
+            error = str(e)
+
+        self.usage_tracker.release_request(provider.name)
+        attempts.append(Attempt(provider.name, "failed", time.perf_counter() - start, error))
+        return None
+
+    def _admit(self, provider: ProviderConfig, priority: str, deadline: float = None) -> bool:
+        """Wait for a request slot on a provider, bounded by the priority class's max wait"""
+        if priority == PRIORITY_INTERACTIVE:
+            max_wait = settings.INTERACTIVE_MAX_WAIT
+        else:
+            max_wait = settings.BULK_MAX_WAIT
+
+        # Replays compress the scheduler's window, so the wait must shrink with it
+        max_wait *= self.time_scale
+
+        if self.scheduler.acquire(provider, priority, deadline=deadline, max_wait=max_wait):
+            return True
+        logger.warning(f"[WARN] {provider.name} cannot admit {priority} request in time")
+        return False
 
-    def chat_completion(self, messages: List[Dict], max_retries: int = None, **kwargs) -> str:
+    def _check_admission(self, providers: List[ProviderConfig], priority: str, deadline: float = None,
+                         from_budget: bool = False):
+        """
+        Reject a request early if no provider can admit it before its deadline
+
+        Raises:
+            DeadlineExceeded: If the deadline came from the call's time budget
+            AdmissionRejected: If the caller's own deadline cannot be met
+        """
+        if deadline is None:
+            return
+        if self.scheduler.earliest_start(providers, priority) > deadline:
+            error_msg = f"No provider can admit {priority} request before its deadline"
+            if from_budget:
+                self._deadline_exceeded([], error_msg)
+            logger.error(error_msg)
+            raise AdmissionRejected(error_msg)
+
+    def _healthy_providers(self, providers: List[ProviderConfig] = None) -> List[ProviderConfig]:
+        """Providers not marked down by health checks; all of them if every one is down"""
+        if providers is None:
+            providers = self.providers
+        healthy = [p for p in providers if self.health.is_available(p.name)]
+        if not healthy and providers:
+            logger.warning("[WARN] All providers are marked unavailable, trying them anyway")
+            return providers
+        return healthy
+
+    def _deadline_exceeded(self, attempts: List[Attempt], error_msg: str = None):
+        """Fail a call whose time budget has run out or cannot be met"""
+        if error_msg is None:
+            error_msg = f"Time budget exhausted after {len(attempts)} attempts"
+        logger.error(error_msg)
+        raise DeadlineExceeded(error_msg, attempts)
+
+    def chat_completion(self, messages: List[Dict], max_retries: int = None,
+                        priority: str = PRIORITY_INTERACTIVE, deadline: float = None,
+                        timeout: float = None, **kwargs) -> str:
         """
         Get chat completion with automatic provider fallback
 
         Args:
             messages: List of message dictionaries
             max_retries: Maximum retries per provider (defaults to settings)
+            priority: Scheduling class, "interactive" or "bulk"
+            deadline: Absolute time.monotonic() by which the whole call must finish
+            timeout: Time budget in seconds for the whole call, across all providers and retries
             **kwargs: Additional parameters for the API call
 
         Returns:
             Response content as string
 
         Raises:
+            AdmissionRejected: If no provider can admit the request before its deadline
+            DeadlineExceeded: If the time budget runs out or no provider can admit the request
+                within it; lists the attempts made
+            CassetteMiss: If replaying and the request was never recorded
             Exception: If all providers fail
         """
         if max_retries is None:
             max_retries = settings.DEFAULT_MAX_RETRIES
 
-        for provider in self.providers:
+        budget_end = None
+        if timeout is not None:
+            budget_end = time.monotonic() + timeout
+            deadline = budget_end if deadline is None else min(deadline, budget_end)
+
+        providers = self._healthy_providers()
+        self._check_admission(providers, priority, deadline,
+                              from_budget=budget_end is not None and deadline == budget_end)
+        attempts: List[Attempt] = []
+        admitted = False
+        budget_limited = False
+        max_tokens = kwargs.get("max_tokens", settings.DEFAULT_MAX_TOKENS)
+
+        for provider in providers:
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._deadline_exceeded(attempts)
+
+                # Skip providers that are not expected to answer within what is left
+                expected = self.health.should_skip(provider.name, remaining, tokens=max_tokens)
+                if expected is not None:
+                    budget_limited = True
+                    logger.info(f"[INFO] Skipping {provider.name}: expected {expected:.2f}s, {remaining:.2f}s left")
+                    attempts.append(Attempt(provider.name, "skipped",
+                                            error=f"expected latency {expected:.2f}s exceeds remaining {remaining:.2f}s"))
+                    continue
+
             logger.info(f"[INFO] Trying {provider.name}...")
 
             for retry in range(max_retries + 1):
-                result = self._make_request(provider, messages, **kwargs)
+                if not self._admit(provider, priority, deadline):
+                    attempts.append(Attempt(provider.name, "not_admitted"))
+                    budget_limited = budget_limited or deadline is not None
+                    break
+                admitted = True
+
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._deadline_exceeded(attempts)
+
+                result = self._make_request(provider, messages, timeout=remaining, attempts=attempts, **kwargs)
 
                 if result:
                     return result
 
                 if retry < max_retries:
-                    exponential_backoff(retry)
+                    if deadline is None:
+                        exponential_backoff(retry, scale=self.time_scale)
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._deadline_exceeded(attempts)
+                        exponential_backoff(retry, max_delay=min(settings.MAX_BACKOFF_DELAY, remaining),
+                                            scale=self.time_scale)
 
             logger.warning(f"[FAIL] {provider.name} failed after {max_retries + 1} attempts")
 
+        if deadline is not None and time.monotonic() >= deadline:
+            self._deadline_exceeded(attempts)
+
+        # Providers were passed over only because of the budget: report why, attempt by attempt
+        if budget_limited:
+            self._deadline_exceeded(attempts, f"No provider could answer within the time budget "
+                                              f"({len(attempts)} attempts)")
+
+        if not admitted:
+            error_msg = f"No provider admitted {priority} request"
+            logger.error(error_msg)
+            raise AdmissionRejected(error_msg)
+
         # If we get here, all providers failed
-        error_msg = f"All {len(self.providers)} API providers failed"
+        error_msg = f"All {len(providers)} API providers failed"
+        logger.error(error_msg)
+        raise Exception(error_msg)
+
+    def _make_batches(self, provider: ProviderConfig, texts: List[str], indices: List[int],
+                      batch_size: int) -> List[List[int]]:
+        """Split text indices into batches that fit a provider's per-request input count and token limits"""
+        limit = min(batch_size, provider.embedding_batch_limit or batch_size)
+        token_limit = provider.embedding_token_limit or float("inf")
+        batches, current, current_tokens = [], [], 0
+
+        for i in indices:
+            tokens = estimate_tokens(texts[i])
+            if current and (len(current) >= limit or current_tokens + tokens > token_limit):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+
+        if current:
+            batches.append(current)
+        return batches
+
+    def _embed_batch(self, provider: ProviderConfig, texts: List[str],
+                     priority: str = PRIORITY_INTERACTIVE) -> Optional["np.ndarray"]:
+        """Embed one batch with a specific provider, returning a (len(texts), dim) float32 array"""
+        if provider.name not in self.clients:
+            logger.error(f"No client available for {provider.name}")
+            return None
+
+        if not self.usage_tracker.reserve_request(provider):
+            return None
+
+        # Batches queue for a free slot instead of being refused: a full rate window is not a
+        # provider failure and must not use up retries or trigger failover
+        self.scheduler.acquire(provider, priority)
+
+        vectors = self._request_embeddings(provider, texts)
+        if vectors is None:
+            self.usage_tracker.release_request(provider.name)
+        return vectors
+
+    def _request_embeddings(self, provider: ProviderConfig, texts: List[str]) -> Optional["np.ndarray"]:
+        """Send one admitted embeddings request and decode the response"""
+        client = self.clients[provider.name]
+
+        try:
+            response = client.embeddings.create(
+                model=provider.embedding_model,
+                input=texts,
+                encoding_format=provider.embedding_encoding
+            )
+
+            vectors = None
+            # Rows start uninitialised, so every row must be written exactly once
+            filled = np.zeros(len(texts), dtype=bool)
+            for item in response.data:
+                if not 0 <= item.index < len(texts) or filled[item.index]:
+                    logger.error(f"[ERROR] {provider.name} returned an invalid or duplicate embedding index {item.index}")
+                    return None
+                # base64 payloads are raw little-endian float32, decoded without building lists
+                if isinstance(item.embedding, str):
+                    vector = np.frombuffer(base64.b64decode(item.embedding), dtype="<f4")
+                else:
+                    vector = np.asarray(item.embedding, dtype=np.float32)
+                if vectors is None:
+                    vectors = np.empty((len(texts), vector.shape[0]), dtype=np.float32)
+                vectors[item.index] = vector
+                filled[item.index] = True
+
+            if vectors is None or not filled.all():
+                logger.error(f"[ERROR] {provider.name} returned {int(filled.sum())} of {len(texts)} embeddings")
+                return None
+
+            usage = response.usage
+            tokens_used = (usage.total_tokens or usage.prompt_tokens) if usage else 0
+            self.usage_tracker.update_usage(provider.name, tokens=tokens_used)
+
+            logger.info(f"[OK] Embedded {len(texts)} texts with {provider.name} - Tokens used: {tokens_used}")
+            self.health.mark_up(provider.name)
+            return vectors
+
+        except (openai.AuthenticationError, openai.PermissionDeniedError) as e:
+            self._key_rejected(provider, e)
+            return None
+        except openai.APIConnectionError as e:
+            self._raise_cassette_miss(provider, e)
+            logger.error(f"[ERROR] API error with {provider.name}: {e}")
+            return None
+        except openai.RateLimitError as e:
+            logger.warning(f"[WARN] Rate limit hit for {provider.name}: {e}")
+            return None
+        except openai.APIError as e:
+            logger.error(f"[ERROR] API error with {provider.name}: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"[FATAL] Unexpected error with {provider.name}: {e}")
+            return None
+
+    def embed(self, texts: List[str], batch_size: int = None, max_retries: int = None,
+              priority: str = PRIORITY_INTERACTIVE) -> "np.ndarray":
+        """
+        Get embeddings with automatic provider fallback
+
+        Repeated texts are embedded once. Batches are sent concurrently, waiting for
+        free slots in the provider's requests_per_minute budget, and only failed
+        batches are retried or moved to the next provider. Vectors from
+        different embedding models are not comparable, so switching to a provider
+        with another model re-embeds every text with that model.
+
+        Args:
+            texts: Texts to embed
+            batch_size: Maximum texts per request (also capped by each provider's limits)
+            max_retries: Maximum retries per provider (defaults to settings)
+            priority: Scheduling class, "interactive" or "bulk"
+
+        Returns:
+            Contiguous float32 array of shape (len(texts), dim), in input order
+
+        Raises:
+            ImportError: If NumPy is not installed
+            CassetteMiss: If replaying and a batch was never recorded
+            Exception: If all embedding providers fail
+        """
+        if np is None:
+            raise ImportError("NumPy package not found. Install with: pip install numpy")
+        if batch_size is None:
+            batch_size = settings.DEFAULT_EMBED_BATCH_SIZE
+        if max_retries is None:
+            max_retries = settings.DEFAULT_MAX_RETRIES
+
+        # Deduplicate, remembering where each input's vector lives
+        positions = {}
+        unique = []
+        inverse = np.empty(len(texts), dtype=np.intp)
+        for i, text in enumerate(texts):
+            j = positions.get(text)
+            if j is None:
+                j = positions[text] = len(unique)
+                unique.append(text)
+            inverse[i] = j
+
+        if not unique:
+            return np.empty((0, 0), dtype=np.float32)
+
+        candidates = [p for p in self.providers if p.supports_embeddings]
+        if not candidates:
+            raise ValueError("No configured provider supports embeddings")
+        candidates = self._healthy_providers(candidates)
+
+        vectors = None
+        model = None
+        done = np.zeros(len(unique), dtype=bool)
+
+        for provider in candidates:
+            if model is not None and provider.embedding_model != model:
+                done[:] = False
+                vectors, model = None, None
+
+            batches = self._make_batches(provider, unique, np.flatnonzero(~done).tolist(), batch_size)
+            logger.info(f"[INFO] Embedding {len(batches)} batches with {provider.name}...")
+
+            for retry in range(max_retries + 1):
+                workers = max(1, min(settings.EMBED_CONCURRENCY, len(batches)))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(
+                        lambda batch: self._embed_batch(provider, [unique[i] for i in batch], priority),
+                        batches
+                    ))
+
+                failed = []
+                for batch, result in zip(batches, results):
+                    if result is not None and vectors is not None and result.shape[1] != vectors.shape[1]:
+                        logger.error(f"[ERROR] {provider.name} returned {result.shape[1]}-dim vectors, expected {vectors.shape[1]}")
+                        result = None
+                    if result is None:
+                        failed.append(batch)
+                        continue
+                    if vectors is None:
+                        vectors = np.empty((len(unique), result.shape[1]), dtype=np.float32)
+                        model = provider.embedding_model
+                    vectors[batch] = result
+                    done[batch] = True
+
+                if not failed:
+                    return vectors[inverse]
+
+                batches = failed
+                if retry < max_retries:
+                    exponential_backoff(retry, scale=self.time_scale)
+
+            logger.warning(f"[FAIL] {provider.name} left {len(batches)} batches unembedded after {max_retries + 1} attempts")
+
+        error_msg = f"All {len(candidates)} embedding providers failed"
         logger.error(error_msg)
         raise Exception(error_msg)
 
@@ -141,6 +558,38 @@ class CascadingAPIClient:
         """Get usage statistics for all providers"""
         return self.usage_tracker.get_usage_stats(self.providers)
 
+    def start_health_prober(self, **kwargs) -> HealthProber:
+        """
+        Validate all keys in parallel, then keep probing providers in the background
+
+        Args:
+            **kwargs: HealthProber options (method, interval, daily_budget, timeout)
+        """
+        if self.prober is None:
+            self.prober = HealthProber(self, **kwargs)
+        self.prober.start()
+        return self.prober
+
+    def stop_health_prober(self):
+        """Stop background health probing and let live traffic decide availability again"""
+        if self.prober is not None:
+            self.prober.stop()
+            # Without probes nothing would ever bring a down provider back
+            for provider in self.providers:
+                self.health.mark_up(provider.name)
+
+    def get_health_stats(self) -> Dict:
+        """Get availability and observed latency estimates for all providers"""
+        return self.health.get_stats()
+
+    def get_probe_stats(self) -> Dict:
+        """Get probe counts and quota cost per provider"""
+        return self.prober.get_stats() if self.prober is not None else {}
+
+    def get_scheduler_stats(self) -> Dict:
+        """Get admission queue depth, window usage and wait times"""
+        return self.scheduler.get_stats()
+
     def get_available_providers(self) -> List[str]:
         """Get list of available provider names"""
         return [p.name for p in self.providers]
\ No newline at end of file
@@ -0,0 +1,297 @@
+"""
+Record/replay cassettes for deterministic offline runs of the cascading client
+"""
+import base64
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+from providers import ProviderConfig
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_VERSION = 1
+RECORD = "record"
+REPLAY = "replay"
+
+# Headers that describe the wire encoding rather than the response itself.
+# Bodies are stored decoded, so these would be wrong on replay.
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "set-cookie"}
+
+# Statuses the OpenAI SDK retries on its own, sleeping for any retry-after hint first
+_SDK_RETRY_STATUSES = {408, 409, 429}
+
+# Placeholder key for providers rebuilt from a cassette; never sent anywhere
+REPLAY_API_KEY = "cassette-replay"
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when a request has no recorded interaction"""
+
+def request_key(method: str, url: str, body: bytes) -> str:
+    """Build the lookup key for a request (auth headers are deliberately excluded)"""
+    digest = hashlib.sha256()
+    digest.update(method.upper().encode())
+    digest.update(b" ")
+    digest.update(str(url).encode())
+    digest.update(b"\n")
+    digest.update(body or b"")
+    return digest.hexdigest()
+
+def _encode_body(body: bytes) -> Dict:
+    try:
+        return {"body": body.decode("utf-8"), "encoding": "utf-8"}
+    except UnicodeDecodeError:
+        return {"body": base64.b64encode(body).decode("ascii"), "encoding": "base64"}
+
+def _decode_body(entry: Dict) -> bytes:
+    if entry.get("encoding") == "base64":
+        return base64.b64decode(entry["body"])
+    return entry.get("body", "").encode("utf-8")
+
+class Cassette:
+    """
+    A file of recorded provider interactions.
+
+    The file is JSON Lines: one compact line per provider definition and per
+    HTTP interaction, appended as traffic happens. On load, interactions are
+    indexed by request key (method, URL and body hash) and served back in the
+    order they were recorded.
+
+    Replays scale recorded latency and the waits between retries of the same
+    request by 1/speed. Waits the SDK takes after a recorded connection error
+    or timeout are its own backoff and are not scaled.
+    """
+
+    def __init__(self, path: str, mode: str = REPLAY, speed: float = 1.0,
+                 allow_repeats: bool = True):
+        """
+        Open a cassette
+
+        Args:
+            path: Cassette file location
+            mode: "record" to capture live traffic, "replay" to serve it back
+            speed: Replay speed multiplier (10 replays ten times faster, 0 disables delays)
+            allow_repeats: In replay, reuse the last interaction once a key's recordings run out
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+
+        self.path = Path(path)
+        self.mode = mode
+        self.speed = speed
+        self.allow_repeats = allow_repeats
+        self._lock = threading.Lock()
+        self._providers: Dict[str, Dict] = {}
+        self._index: Dict[str, deque] = {}
+        self._last: Dict[str, Dict] = {}
+        self._stats = {"recorded": 0, "replayed": 0, "misses": 0, "simulated_latency": 0.0}
+        self._file = None
+        self._started = time.monotonic()
+
+        if mode == RECORD:
+            self._file = open(self.path, "w")
+            self._write({"type": "meta", "version": CASSETTE_VERSION})
+        else:
+            self._load()
+
+    def _load(self):
+        """Read a cassette file and build the request index"""
+        with open(self.path, "r") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                kind = entry.get("type")
+                if kind == "meta":
+                    if entry.get("version") != CASSETTE_VERSION:
+                        raise ValueError(f"Unsupported cassette version in {self.path}: {entry.get('version')}")
+                elif kind == "provider":
+                    self._providers.setdefault(entry["config"]["name"], entry["config"])
+                elif kind == "interaction":
+                    self._index.setdefault(entry["key"], deque()).append(entry)
+                else:
+                    logger.warning(f"Skipping unknown cassette entry on line {line_no} of {self.path}")
+
+        total = sum(len(q) for q in self._index.values())
+        logger.info(f"Loaded cassette {self.path}: {total} interactions, {len(self._index)} unique requests")
+
+    def _write(self, entry: Dict):
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+    def register_providers(self, providers: List[ProviderConfig]):
+        """Record provider definitions (without API keys) so replay can rebuild the cascade"""
+        if self.mode != RECORD:
+            return
+        with self._lock:
+            for provider in providers:
+                if provider.name in self._providers:
+                    continue
+                config = asdict(provider)
+                config.pop("api_key", None)
+                self._providers[provider.name] = config
+                self._write({"type": "provider", "config": config})
+
+    def providers(self) -> List[ProviderConfig]:
+        """Rebuild the recorded providers, in recording order, with a placeholder API key"""
+        return [ProviderConfig(api_key=REPLAY_API_KEY, **config) for config in self._providers.values()]
+
+    def record(self, request: httpx.Request, status: int = None, headers: List = None,
+               body: bytes = b"", elapsed: float = 0.0, error: Exception = None):
+        """Append one interaction to the cassette"""
+        entry = {
+            "type": "interaction",
+            "key": request_key(request.method, request.url, request.content),
+            "method": request.method,
+            "url": str(request.url),
+            "t": round(time.monotonic() - self._started, 6),
+            "elapsed": round(elapsed, 6),
+        }
+        if error is not None:
+            entry["error"] = {"type": type(error).__name__, "message": str(error)}
+        else:
+            entry["status"] = status
+            entry["headers"] = headers or []
+            entry.update(_encode_body(body))
+
+        with self._lock:
+            self._write(entry)
+            self._stats["recorded"] += 1
+
+    def lookup(self, request: httpx.Request) -> Dict:
+        """Return the next recorded interaction for a request"""
+        key = request_key(request.method, request.url, request.content)
+        with self._lock:
+            queue = self._index.get(key)
+            if queue:
+                entry = queue.popleft()
+                if queue:
+                    # Idle time before the same request was sent again (SDK or cascade retry);
+                    # "t" is when an interaction finished, so the next one started at t - elapsed
+                    gap = queue[0]["t"] - queue[0]["elapsed"] - entry["t"]
+                    entry = dict(entry, gap=max(0.0, gap))
+                self._last[key] = entry
+            elif self.allow_repeats and key in self._last:
+                entry = self._last[key]
+            else:
+                self._stats["misses"] += 1
+                raise CassetteMiss(f"No recorded interaction for {request.method} {request.url}")
+            self._stats["replayed"] += 1
+        return entry
+
+    @property
+    def time_scale(self) -> float:
+        """Factor applied to waits while replaying (1 when recording, 0 when delays are disabled)"""
+        if self.mode != REPLAY:
+            return 1.0
+        if not self.speed or self.speed <= 0:
+            return 0.0
+        return 1.0 / self.speed
+
+    def delay_for(self, entry: Dict) -> float:
+        """Scaled replay delay for an interaction"""
+        delay = entry.get("elapsed", 0.0) * self.time_scale
+        with self._lock:
+            self._stats["simulated_latency"] += delay
+        return delay
+
+    def retry_after_for(self, entry: Dict) -> float:
+        """Scaled wait the SDK should take before retrying this response, in seconds"""
+        # The SDK ignores hints of 0, so a disabled delay still needs a tiny positive wait
+        return max(entry.get("gap", 0.0) * self.time_scale, 0.001)
+
+    def transport(self) -> httpx.BaseTransport:
+        """Build the httpx transport for this cassette's mode"""
+        if self.mode == RECORD:
+            return RecordingTransport(self)
+        return ReplayTransport(self)
+
+    def get_stats(self) -> Dict:
+        """Get record/replay counters; simulated_latency is the total replay sleep time"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["mode"] = self.mode
+        stats["simulated_latency"] = round(stats["simulated_latency"], 6)
+        return stats
+
+    def close(self):
+        """Close the cassette file"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class RecordingTransport(httpx.BaseTransport):
+    """httpx transport that forwards requests and writes each exchange to a cassette"""
+
+    def __init__(self, cassette: Cassette, transport: httpx.BaseTransport = None):
+        self.cassette = cassette
+        self._transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        start = time.perf_counter()
+        try:
+            response = self._transport.handle_request(request)
+            try:
+                body = response.read()
+            finally:
+                response.close()
+        except Exception as e:
+            self.cassette.record(request, elapsed=time.perf_counter() - start, error=e)
+            raise
+        elapsed = time.perf_counter() - start
+
+        headers = [[k, v] for k, v in response.headers.items() if k.lower() not in _DROPPED_HEADERS]
+        self.cassette.record(request, status=response.status_code, headers=headers,
+                             body=body, elapsed=elapsed)
+        return httpx.Response(response.status_code, headers=headers, content=body,
+                              request=request, extensions=response.extensions)
+
+    def close(self):
+        self._transport.close()
+
+class ReplayTransport(httpx.BaseTransport):
+    """httpx transport that serves responses from a cassette with their recorded timing"""
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        entry = self.cassette.lookup(request)
+
+        delay = self.cassette.delay_for(entry)
+        if delay > 0:
+            time.sleep(delay)
+
+        error = entry.get("error")
+        if error:
+            # Re-raise as the recorded httpx error type so the SDK reacts the same way
+            error_type = getattr(httpx, error["type"], None)
+            if not (isinstance(error_type, type) and issubclass(error_type, httpx.TransportError)):
+                error_type = httpx.TransportError
+            raise error_type(error["message"], request=request)
+
+        status = entry["status"]
+        headers = entry["headers"]
+        if "gap" in entry and (status in _SDK_RETRY_STATUSES or status >= 500):
+            # Replace the server's retry hint with the recorded gap, scaled, so the SDK's
+            # retry sleep follows the replay speed instead of its own backoff
+            headers = [[k, v] for k, v in headers if k.lower() not in ("retry-after", "retry-after-ms")]
+            headers.append(["retry-after-ms", f"{self.cassette.retry_after_for(entry) * 1000:.3f}"])
+
+        return httpx.Response(status, headers=headers, content=_decode_body(entry), request=request)
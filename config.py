@@ -21,6 +21,27 @@ class Settings:
     DEFAULT_TEMPERATURE: float = 0.7
     DEFAULT_MAX_RETRIES: int = 2
 
+    # Embedding settings
+    DEFAULT_EMBED_BATCH_SIZE: int = 64
+    EMBED_CONCURRENCY: int = 4
+
+    # Admission scheduling
+    INTERACTIVE_RESERVE: float = 0.2
+    INTERACTIVE_MAX_WAIT: float = 2.0
+    BULK_MAX_WAIT: float = 60.0
+
+    # Weight of the newest sample in per-provider latency estimates
+    LATENCY_EWMA_ALPHA: float = 0.3
+    LATENCY_MAX_AGE: float = 300.0
+    LATENCY_RETRY_AFTER_SKIPS: int = 5
+
+    # Background health probing (the default interval spreads the daily budget over 24 hours)
+    HEALTH_PROBE: bool = False
+    PROBE_METHOD: str = "models"
+    PROBE_INTERVAL: float = 1800.0
+    PROBE_DAILY_BUDGET: int = 48
+    PROBE_TIMEOUT: float = 5.0
+
     # Backoff settings
     MAX_BACKOFF_DELAY: int = 60
     BASE_BACKOFF_DELAY: int = 2
@@ -35,6 +56,19 @@ class Settings:
             DEFAULT_MAX_TOKENS=int(os.getenv("DEFAULT_MAX_TOKENS", "500")),
             DEFAULT_TEMPERATURE=float(os.getenv("DEFAULT_TEMPERATURE", "0.7")),
             DEFAULT_MAX_RETRIES=int(os.getenv("DEFAULT_MAX_RETRIES", "2")),
+            DEFAULT_EMBED_BATCH_SIZE=int(os.getenv("DEFAULT_EMBED_BATCH_SIZE", "64")),
+            EMBED_CONCURRENCY=int(os.getenv("EMBED_CONCURRENCY", "4")),
+            INTERACTIVE_RESERVE=float(os.getenv("INTERACTIVE_RESERVE", "0.2")),
+            INTERACTIVE_MAX_WAIT=float(os.getenv("INTERACTIVE_MAX_WAIT", "2.0")),
+            BULK_MAX_WAIT=float(os.getenv("BULK_MAX_WAIT", "60.0")),
+            LATENCY_EWMA_ALPHA=float(os.getenv("LATENCY_EWMA_ALPHA", "0.3")),
+            LATENCY_MAX_AGE=float(os.getenv("LATENCY_MAX_AGE", "300")),
+            LATENCY_RETRY_AFTER_SKIPS=int(os.getenv("LATENCY_RETRY_AFTER_SKIPS", "5")),
+            HEALTH_PROBE=os.getenv("HEALTH_PROBE", "false").lower() in ("1", "true", "yes"),
+            PROBE_METHOD=os.getenv("PROBE_METHOD", "models"),
+            PROBE_INTERVAL=float(os.getenv("PROBE_INTERVAL", "1800")),
+            PROBE_DAILY_BUDGET=int(os.getenv("PROBE_DAILY_BUDGET", "48")),
+            PROBE_TIMEOUT=float(os.getenv("PROBE_TIMEOUT", "5")),
         )
 
 # Global settings instance
@@ -0,0 +1,130 @@
+"""
+Provider health tracking: availability and observed latency estimates
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+class ProviderHealth:
+    """
+    Track availability and observed request latency per provider.
+
+    Latency is an exponentially weighted mean of request durations, kept
+    alongside the mean number of tokens those requests generated. Requests
+    asking for fewer tokens than that get a proportionally smaller estimate,
+    so a long generation does not inflate the estimate for short calls.
+    Estimates expire after LATENCY_MAX_AGE seconds, and a provider skipped
+    LATENCY_RETRY_AFTER_SKIPS times in a row is let through once so a
+    recovered provider can produce a fresh sample.
+    """
+
+    def __init__(self, alpha: float = None, max_age: float = None, retry_after_skips: int = None):
+        """
+        Initialize health tracking
+
+        Args:
+            alpha: Weight of the newest sample in the latency moving averages (defaults to settings)
+            max_age: Seconds after the last sample when a latency estimate is ignored (defaults to settings)
+            retry_after_skips: Consecutive latency skips after which a provider is tried anyway
+                (defaults to settings)
+        """
+        self.alpha = settings.LATENCY_EWMA_ALPHA if alpha is None else alpha
+        self.max_age = settings.LATENCY_MAX_AGE if max_age is None else max_age
+        self.retry_after_skips = settings.LATENCY_RETRY_AFTER_SKIPS if retry_after_skips is None else retry_after_skips
+        self._lock = threading.Lock()
+        self._latency: Dict[str, Dict[str, float]] = {}
+        self._samples: Dict[str, int] = {}
+        self._skips: Dict[str, int] = {}
+        self._probe_latency: Dict[str, float] = {}
+        self._down: Dict[str, str] = {}
+
+    def observe_latency(self, provider_name: str, seconds: float, tokens: int = 1):
+        """Record the duration of a successful request that generated `tokens` completion tokens"""
+        tokens = max(1, tokens or 1)
+        sample = {"tokens": tokens, "seconds": seconds}
+        with self._lock:
+            model = self._latency.get(provider_name)
+            if model is None:
+                model = self._latency[provider_name] = sample
+            else:
+                for key, value in sample.items():
+                    model[key] = self.alpha * value + (1 - self.alpha) * model[key]
+            model["at"] = time.monotonic()
+            self._samples[provider_name] = self._samples.get(provider_name, 0) + 1
+            self._skips[provider_name] = 0
+        logger.debug(f"Observed {seconds:.3f}s latency for {tokens} tokens from {provider_name}")
+
+    def latency(self, provider_name: str, tokens: int = 1) -> Optional[float]:
+        """Estimate how long a request generating up to `tokens` tokens takes, or None if unknown or stale"""
+        with self._lock:
+            model = self._latency.get(provider_name)
+            if model is None or time.monotonic() - model["at"] > self.max_age:
+                return None
+            # Only scale down: a short observed generation says nothing about long ones
+            return model["seconds"] * min(1.0, max(1, tokens) / model["tokens"])
+
+    def should_skip(self, provider_name: str, remaining: float, tokens: int = 1) -> Optional[float]:
+        """
+        Decide whether a provider is too slow for the remaining time budget
+
+        Returns:
+            The estimated latency if the provider should be skipped, otherwise None
+        """
+        expected = self.latency(provider_name, tokens)
+        if expected is None or expected <= remaining:
+            return None
+        with self._lock:
+            skips = self._skips.get(provider_name, 0) + 1
+            if skips >= self.retry_after_skips:
+                # Let it through so a recovered provider can refresh its estimate
+                self._skips[provider_name] = 0
+                logger.info(f"[INFO] Trying {provider_name} despite expected {expected:.2f}s to refresh its latency")
+                return None
+            self._skips[provider_name] = skips
+        return expected
+
+    def observe_probe(self, provider_name: str, seconds: float):
+        """Record the round trip of a health probe that is not comparable to a real request"""
+        with self._lock:
+            self._probe_latency[provider_name] = seconds
+
+    def mark_up(self, provider_name: str):
+        """Mark a provider as reachable with a working key"""
+        with self._lock:
+            if self._down.pop(provider_name, None) is not None:
+                logger.info(f"[OK] {provider_name} is available again")
+
+    def mark_down(self, provider_name: str, reason: str):
+        """Mark a provider as unusable until it is marked up again"""
+        with self._lock:
+            if provider_name not in self._down:
+                logger.warning(f"[WARN] Marking {provider_name} unavailable: {reason}")
+            self._down[provider_name] = reason
+
+    def is_available(self, provider_name: str) -> bool:
+        """Check if a provider is usable; providers never marked down are assumed available"""
+        with self._lock:
+            return provider_name not in self._down
+
+    def get_stats(self) -> Dict:
+        """Get availability and latency estimates for all known providers"""
+        with self._lock:
+            names = set(self._latency) | set(self._probe_latency) | set(self._down)
+            stats = {}
+            for name in sorted(names):
+                model = self._latency.get(name)
+                latency = model["seconds"] if model is not None else None
+                probe_latency = self._probe_latency.get(name)
+                stats[name] = {
+                    "available": name not in self._down,
+                    "down_reason": self._down.get(name, ""),
+                    "latency": round(latency, 4) if latency is not None else None,
+                    "samples": self._samples.get(name, 0),
+                    "probe_latency": round(probe_latency, 4) if probe_latency is not None else None,
+                }
+            return stats
@@ -0,0 +1,238 @@
+"""
+Background health probing and parallel key validation for providers
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import openai
+
+from config import settings
+from providers import ProviderConfig
+from scheduler import PRIORITY_BULK
+
+logger = logging.getLogger(__name__)
+
+PROBE_MODELS = "models"
+PROBE_COMPLETION = "completion"
+
+class HealthProber:
+    """
+    Validate provider keys in parallel and keep probing them in the background.
+
+    Probe results mark providers up or down in the client's ProviderHealth so
+    live requests skip providers that are known to be failing. "models" probes
+    list the provider's models and cost no tokens; "completion" probes send a
+    1-token completion, which is charged to the provider's daily usage. Probe
+    round trips are reported as probe latency only and never feed the latency
+    estimates used for time budgets. Each provider gets at most daily_budget
+    probes per day, and probes only use spare bulk capacity in the scheduler.
+    Once a provider's budget is used up it is no longer held down, so live
+    traffic decides its state until the next day.
+    """
+
+    def __init__(self, client, method: str = None, interval: float = None,
+                 daily_budget: int = None, timeout: float = None):
+        """
+        Initialize the prober
+
+        Args:
+            client: CascadingAPIClient whose providers are probed
+            method: "models" or "completion" (defaults to settings)
+            interval: Seconds between background probe rounds (defaults to settings)
+            daily_budget: Maximum probes per provider per day (defaults to settings)
+            timeout: HTTP timeout for each probe in seconds (defaults to settings)
+        """
+        self.client = client
+        self.method = method or settings.PROBE_METHOD
+        self.interval = settings.PROBE_INTERVAL if interval is None else interval
+        self.daily_budget = settings.PROBE_DAILY_BUDGET if daily_budget is None else daily_budget
+        self.timeout = settings.PROBE_TIMEOUT if timeout is None else timeout
+
+        if self.method not in (PROBE_MODELS, PROBE_COMPLETION):
+            raise ValueError(f"Unknown probe method: {self.method}")
+        if self.interval * self.daily_budget < 86400:
+            hours = self.interval * self.daily_budget / 3600
+            logger.warning(f"Probe budget of {self.daily_budget}/day runs out after about {hours:.1f}h "
+                           f"at a {self.interval}s interval; live traffic decides availability after that")
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._date = datetime.now().strftime('%Y-%m-%d')
+        self._stats: Dict[str, Dict] = {p.name: self._empty_stats() for p in client.providers}
+
+    @staticmethod
+    def _empty_stats() -> Dict:
+        return {
+            "probes_today": 0,
+            "probes_total": 0,
+            "failures": 0,
+            "skipped": 0,
+            "quota_requests": 0,
+            "quota_tokens": 0,
+            "last_ok": None,
+            "last_latency": None,
+            "last_error": "",
+        }
+
+    def _reserve_probe(self, provider: ProviderConfig) -> bool:
+        """Count a probe against the provider's daily budget"""
+        with self._lock:
+            current_date = datetime.now().strftime('%Y-%m-%d')
+            if current_date != self._date:
+                self._date = current_date
+                for stats in self._stats.values():
+                    stats["probes_today"] = 0
+
+            stats = self._stats.setdefault(provider.name, self._empty_stats())
+            if stats["probes_today"] >= self.daily_budget:
+                stats["skipped"] += 1
+                return False
+            stats["probes_today"] += 1
+            stats["probes_total"] += 1
+            return True
+
+    def _record(self, provider: ProviderConfig, ok: bool, latency: float = None, error: str = "",
+                tokens: int = None):
+        with self._lock:
+            stats = self._stats[provider.name]
+            stats["last_ok"] = ok
+            stats["last_latency"] = round(latency, 4) if latency is not None else None
+            stats["last_error"] = error
+            if not ok:
+                stats["failures"] += 1
+            if tokens is not None:
+                stats["quota_requests"] += 1
+                stats["quota_tokens"] += tokens
+
+    def probe(self, provider: ProviderConfig) -> Optional[bool]:
+        """
+        Probe one provider and update its health
+
+        Returns:
+            True if healthy, False if marked down, None if the probe was skipped
+        """
+        health = self.client.health
+        if provider.name not in self.client.clients:
+            health.mark_down(provider.name, "no client available")
+            return False
+
+        if self.method == PROBE_COMPLETION and not self.client.usage_tracker.check_limits(provider):
+            return None
+
+        if not self._reserve_probe(provider):
+            # Without probes nothing would ever bring the provider back, so let live traffic decide
+            logger.debug(f"Probe budget for {provider.name} used up for today")
+            health.mark_up(provider.name)
+            return None
+
+        # Probes only take capacity that no real request is waiting for, and stay out of
+        # the scheduler's per-class statistics
+        if not self.client.scheduler.acquire(provider, PRIORITY_BULK, max_wait=0, record_stats=False):
+            with self._lock:
+                stats = self._stats[provider.name]
+                stats["probes_today"] -= 1
+                stats["probes_total"] -= 1
+                stats["skipped"] += 1
+            return None
+
+        client = self.client.clients[provider.name].with_options(timeout=self.timeout, max_retries=0)
+        start = time.perf_counter()
+        tokens = None
+        try:
+            if self.method == PROBE_COMPLETION:
+                response = client.chat.completions.create(
+                    model=provider.model,
+                    messages=[{"role": "user", "content": "ping"}],
+                    max_tokens=1,
+                    temperature=0
+                )
+                tokens = response.usage.total_tokens if response.usage else 0
+                self.client.usage_tracker.update_usage(provider.name, requests=1, tokens=tokens)
+            else:
+                client.models.list()
+        except (openai.AuthenticationError, openai.PermissionDeniedError) as e:
+            return self._fail(provider, start, f"invalid API key: {e}")
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            return self._fail(provider, start, f"unreachable: {e}")
+        except openai.RateLimitError:
+            # Reachable and the key was accepted, just busy
+            logger.debug(f"Probe of {provider.name} was rate limited; treating as available")
+        except openai.NotFoundError as e:
+            if self.method != PROBE_MODELS:
+                return self._fail(provider, start, f"model not found: {e}")
+            # Some OpenAI-compatible APIs have no /models route
+            logger.debug(f"{provider.name} has no models endpoint; treating as available")
+        except openai.APIStatusError as e:
+            # Any other rejection means live requests would fail the same way
+            return self._fail(provider, start, f"probe rejected ({e.status_code}): {e}")
+        except Exception as e:
+            return self._fail(provider, start, f"probe error: {e}")
+
+        elapsed = time.perf_counter() - start
+        # A 1-token probe says little about real requests, so it stays out of the latency estimate
+        health.observe_probe(provider.name, elapsed)
+        health.mark_up(provider.name)
+        self._record(provider, True, elapsed, tokens=tokens)
+        return True
+
+    def _fail(self, provider: ProviderConfig, start: float, reason: str) -> bool:
+        self.client.health.mark_down(provider.name, reason)
+        self._record(provider, False, time.perf_counter() - start, reason)
+        return False
+
+    def validate_all(self, providers: List[ProviderConfig] = None) -> Dict[str, Optional[bool]]:
+        """Probe all providers in parallel, returning each provider's result"""
+        providers = providers or self.client.providers
+        with ThreadPoolExecutor(max_workers=max(1, len(providers))) as executor:
+            results = list(executor.map(self.probe, providers))
+
+        outcome = {p.name: result for p, result in zip(providers, results)}
+        healthy = sum(1 for result in results if result)
+        logger.info(f"[INFO] Health probe: {healthy}/{len(providers)} providers available")
+        return outcome
+
+    def start(self, validate: bool = True):
+        """
+        Start background probing
+
+        Args:
+            validate: Validate all providers before returning, so the first request benefits
+        """
+        if self.is_running:
+            return
+        if validate:
+            self.validate_all()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="health-prober", daemon=True)
+        self._thread.start()
+        logger.info(f"Started health prober ({self.method} probes every {self.interval}s)")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.validate_all()
+            except Exception as e:
+                logger.error(f"[ERROR] Health probe round failed: {e}")
+
+    @property
+    def is_running(self) -> bool:
+        """Check if background probing is active"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        """Stop background probing"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+            self._thread = None
+
+    def get_stats(self) -> Dict:
+        """Get probe counts, quota cost and last results per provider"""
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
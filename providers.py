@@ -15,6 +15,10 @@ class ProviderConfig:
     daily_limit: int
     token_limit: int
     requests_per_minute: int = 60
+    embedding_model: str = ""
+    embedding_batch_limit: int = 0
+    embedding_token_limit: int = 0
+    embedding_encoding: str = "base64"
 
     def __post_init__(self):
         """Validate provider configuration"""
@@ -26,6 +30,11 @@ class ProviderConfig:
         """Check if provider has valid API key"""
         return bool(self.api_key and self.api_key.strip())
 
+    @property
+    def supports_embeddings(self) -> bool:
+        """Check if provider has an embeddings model configured"""
+        return bool(self.embedding_model)
+
 def get_all_providers() -> List[ProviderConfig]:
     """Get all configured providers in priority order"""
     return [
@@ -63,7 +72,9 @@ def get_all_providers() -> List[ProviderConfig]:
             model="meta-llama/Llama-3.3-70B-Instruct-Turbo",
             daily_limit=500,
             token_limit=50000,
-            requests_per_minute=10
+            requests_per_minute=10,
+            embedding_model="BAAI/bge-base-en-v1.5",
+            embedding_batch_limit=128
         ),
         ProviderConfig(
             name="Mistral",
@@ -72,7 +83,11 @@ def get_all_providers() -> List[ProviderConfig]:
             model="mistral-7b-instruct",
             daily_limit=200,
             token_limit=20000,
-            requests_per_minute=20
+            requests_per_minute=20,
+            embedding_model="mistral-embed",
+            embedding_batch_limit=128,
+            embedding_token_limit=16384,
+            embedding_encoding="float"
         ),
         ProviderConfig(
             name="HuggingFace",
@@ -90,7 +105,9 @@ def get_all_providers() -> List[ProviderConfig]:
             model="accounts/fireworks/models/llama-v3p3-70b-instruct",
             daily_limit=500,
             token_limit=10000,
-            requests_per_minute=5
+            requests_per_minute=5,
+            embedding_model="nomic-ai/nomic-embed-text-v1.5",
+            embedding_batch_limit=256
         )
     ]
 
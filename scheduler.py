@@ -0,0 +1,222 @@
+"""
+Priority and deadline-aware admission scheduling for provider requests
+"""
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, List
+
+from config import settings
+from providers import ProviderConfig
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+
+# Lower rank is served first
+PRIORITIES = {PRIORITY_INTERACTIVE: 0, PRIORITY_BULK: 1}
+
+# requests_per_minute is enforced over a sliding window of this many seconds
+RATE_WINDOW = 60.0
+
+class AdmissionRejected(Exception):
+    """Raised when no provider can admit a request before its deadline"""
+
+class AdmissionScheduler:
+    """
+    Admit requests to providers within their requests_per_minute budgets.
+
+    Interactive requests may use a provider's full per-minute budget and are
+    always served before queued bulk requests. Bulk requests only use what is
+    left after a reserved share is held back for interactive traffic.
+    Deadlines are absolute time.monotonic() values; a request whose estimated
+    start time is past its deadline is rejected without queueing.
+    """
+
+    def __init__(self, providers: List[ProviderConfig], interactive_reserve: float = None,
+                 time_scale: float = 1.0):
+        """
+        Initialize the scheduler
+
+        Args:
+            providers: Providers whose request rates are scheduled
+            interactive_reserve: Fraction of each provider's per-minute budget held back for
+                interactive requests (defaults to settings)
+            time_scale: Factor applied to the rate window, e.g. 0.1 when replaying a cassette at
+                10x speed (0 disables rate limiting)
+        """
+        if interactive_reserve is None:
+            interactive_reserve = settings.INTERACTIVE_RESERVE
+        self.interactive_reserve = interactive_reserve
+        self.window_seconds = RATE_WINDOW * time_scale
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._limits: Dict[str, int] = {}
+        self._windows: Dict[str, deque] = {}
+        self._queues: Dict[str, List] = {}
+        self._stats = {
+            priority: {"admitted": 0, "rejected": 0, "timed_out": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for priority in PRIORITIES
+        }
+        for provider in providers:
+            self._register(provider)
+
+    def _register(self, provider: ProviderConfig):
+        if provider.name not in self._limits:
+            self._limits[provider.name] = max(1, provider.requests_per_minute)
+            self._windows[provider.name] = deque()
+            self._queues[provider.name] = []
+
+    def _capacity(self, name: str, priority: str) -> int:
+        """Requests per window a priority class may use on a provider"""
+        limit = self._limits[name]
+        if priority == PRIORITY_INTERACTIVE:
+            return limit
+        reserved = math.ceil(limit * self.interactive_reserve)
+        return max(1, limit - reserved)
+
+    def _prune(self, name: str, now: float):
+        window = self._windows[name]
+        while window and now - window[0] >= self.window_seconds:
+            window.popleft()
+
+    def _ahead(self, name: str, rank: int) -> int:
+        """Queued requests that would be served before a new request of this rank"""
+        return sum(1 for queued_rank, _ in self._queues[name] if queued_rank <= rank)
+
+    def _estimate_start(self, name: str, priority: str, now: float, ahead: int) -> float:
+        """Estimate when a request could be admitted, given the requests queued ahead of it"""
+        self._prune(name, now)
+        window = self._windows[name]
+        capacity = self._capacity(name, priority)
+
+        # Index of the window entry whose expiry frees the slot for this request
+        slot = len(window) + ahead - capacity
+        if slot < 0:
+            return now
+        if slot < len(window):
+            return window[slot] + self.window_seconds
+        # Past the current window, each further window frees another `capacity` slots
+        return now + self.window_seconds * (1 + (slot - len(window)) // capacity)
+
+    def estimate_start(self, provider: ProviderConfig, priority: str = PRIORITY_INTERACTIVE) -> float:
+        """Estimate the time.monotonic() at which a new request could be admitted to a provider"""
+        rank = self._rank(priority)
+        with self._cond:
+            self._register(provider)
+            return self._estimate_start(provider.name, priority, time.monotonic(),
+                                        self._ahead(provider.name, rank))
+
+    def earliest_start(self, providers: List[ProviderConfig], priority: str = PRIORITY_INTERACTIVE) -> float:
+        """Earliest estimated admission time across providers"""
+        return min(self.estimate_start(p, priority) for p in providers)
+
+    @staticmethod
+    def _rank(priority: str) -> int:
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        return PRIORITIES[priority]
+
+    def acquire(self, provider: ProviderConfig, priority: str = PRIORITY_INTERACTIVE,
+                deadline: float = None, max_wait: float = None, record_stats: bool = True) -> bool:
+        """
+        Wait for a request slot on a provider
+
+        Args:
+            provider: Provider to send the request to
+            priority: "interactive" or "bulk"
+            deadline: Absolute time.monotonic() by which the request must be admitted
+            max_wait: Maximum seconds to wait for this provider
+            record_stats: Count the request in the per-class statistics (the slot is used either way)
+
+        Returns:
+            True if admitted, False if the slot could not be obtained in time
+        """
+        rank = self._rank(priority)
+        # Uncounted requests (e.g. health probes) update a throwaway copy
+        stats = self._stats[priority] if record_stats else dict(self._stats[priority])
+
+        with self._cond:
+            self._register(provider)
+            name = provider.name
+            queue = self._queues[name]
+            start = time.monotonic()
+
+            give_up = deadline
+            if max_wait is not None:
+                give_up = start + max_wait if give_up is None else min(give_up, start + max_wait)
+
+            # Reject up front rather than queue for a slot that opens too late
+            if give_up is not None and self._estimate_start(name, priority, start, self._ahead(name, rank)) > give_up:
+                stats["rejected"] += 1
+                logger.debug(f"Rejected {priority} request for {name}: no slot before deadline")
+                return False
+
+            entry = (rank, next(self._seq))
+            heapq.heappush(queue, entry)
+            granted = False
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._prune(name, now)
+                    window = self._windows[name]
+
+                    if queue[0] == entry and len(window) < self._capacity(name, priority):
+                        heapq.heappop(queue)
+                        window.append(now)
+                        granted = True
+                        waited = now - start
+                        stats["admitted"] += 1
+                        stats["total_wait"] += waited
+                        stats["max_wait"] = max(stats["max_wait"], waited)
+                        return True
+
+                    if give_up is not None and now >= give_up:
+                        stats["timed_out"] += 1
+                        return False
+
+                    # Sleep until the oldest slot expires, the deadline, or another request moves
+                    timeout = window[0] + self.window_seconds - now if window else None
+                    if give_up is not None:
+                        timeout = give_up - now if timeout is None else min(timeout, give_up - now)
+                    self._cond.wait(timeout=timeout)
+            finally:
+                if not granted:
+                    queue.remove(entry)
+                    heapq.heapify(queue)
+                self._cond.notify_all()
+
+    def get_stats(self) -> Dict:
+        """Get queue depth, window usage and wait times"""
+        with self._cond:
+            now = time.monotonic()
+            providers = {}
+            for name, limit in self._limits.items():
+                self._prune(name, now)
+                depth = {priority: 0 for priority in PRIORITIES}
+                for rank, _ in self._queues[name]:
+                    depth[next(p for p, r in PRIORITIES.items() if r == rank)] += 1
+                providers[name] = {
+                    "queue_depth": depth,
+                    "requests_in_window": len(self._windows[name]),
+                    "requests_per_minute": limit,
+                    "bulk_capacity": self._capacity(name, PRIORITY_BULK),
+                }
+
+            classes = {}
+            for priority, stats in self._stats.items():
+                admitted = stats["admitted"]
+                classes[priority] = {
+                    "admitted": admitted,
+                    "rejected": stats["rejected"],
+                    "timed_out": stats["timed_out"],
+                    "avg_wait": round(stats["total_wait"] / admitted, 4) if admitted else 0.0,
+                    "max_wait": round(stats["max_wait"], 4),
+                }
+
+        return {"providers": providers, "classes": classes}
@@ -4,18 +4,33 @@ Test script to verify individual provider functionality
 """
 import sys
 from cascade import CascadingAPIClient
-from providers import get_all_providers, get_available_providers
+from cassette import Cassette, RECORD, REPLAY
+from prober import HealthProber
+from providers import get_all_providers
 from utils import setup_logging, format_usage_display
 
 # Setup logging for tests
 setup_logging()
 
+# Cassette shared by every client in this run (set with --record/--replay)
+cassette = None
+
+def _all_providers():
+    """Providers to test: the recorded ones when replaying, otherwise all configured"""
+    if cassette is not None and cassette.mode == REPLAY:
+        return cassette.providers()
+    return get_all_providers()
+
+def _available_providers():
+    """Providers with keys (or recorded traffic) available"""
+    return [p for p in _all_providers() if p.is_available]
+
 def test_individual_providers():
     """Test each provider individually"""
     print("[INFO] Testing Individual API Providers")
     print("=" * 40)
 
-    all_providers = get_all_providers()
+    all_providers = _all_providers()
     working_providers = []
     failed_providers = []
 
@@ -28,7 +43,7 @@ def test_individual_providers():
 
         try:
             # Create client with just this provider
-            client = CascadingAPIClient([provider])
+            client = CascadingAPIClient([provider], cassette=cassette)
 
             # Simple test message
             response = client.chat_completion([
@@ -56,19 +71,43 @@ def test_individual_providers():
 
     return len(working_providers) > 0
 
+def test_health_probe():
+    """Validate all provider keys in parallel with cheap health probes"""
+    print("[INFO] Probing API Providers in Parallel")
+    print("=" * 40)
+
+    available_providers = _available_providers()
+    if not available_providers:
+        print("[FAIL] No providers available to probe")
+        return False
+
+    client = CascadingAPIClient(available_providers, cassette=cassette)
+    results = HealthProber(client).validate_all()
+    health = client.get_health_stats()
+
+    for name, result in results.items():
+        if result is None:
+            print(f"[WARN] {name}: Probe skipped")
+        elif result:
+            print(f"[OK] {name}: Available ({health[name]['probe_latency']}s)")
+        else:
+            print(f"[FAIL] {name}: {health[name]['down_reason']}")
+
+    return any(results.values())
+
 def test_cascading_functionality():
     """Test the cascading functionality"""
     print("\n[INFO] Testing Cascading Functionality")
     print("=" * 35)
 
     try:
-        available_providers = get_available_providers()
+        available_providers = _available_providers()
 
         if not available_providers:
             print("[FAIL] No providers available for cascading test")
             return False
 
-        client = CascadingAPIClient()
+        client = CascadingAPIClient(available_providers, cassette=cassette)
         print(f"[INFO] Initialized with {len(client.providers)} providers")
 
         # Test with a standard question
@@ -97,7 +136,7 @@ def test_error_handling():
     print("=" * 25)
 
     try:
-        client = CascadingAPIClient()
+        client = CascadingAPIClient(_available_providers(), cassette=cassette)
 
         # Test with empty messages (should fail gracefully)
         try:
@@ -186,12 +225,34 @@ def run_comprehensive_test():
 
 def main():
     """Main test function"""
-    if len(sys.argv) > 1 and sys.argv[1] in ['--quick', '-q']:
-        # Quick test mode
-        test_individual_providers()
-    else:
-        # Comprehensive test mode
-        run_comprehensive_test()
+    global cassette
+    args = sys.argv[1:]
+
+    # --record PATH captures live traffic; --replay PATH runs offline from it
+    for flag, mode in (('--record', RECORD), ('--replay', REPLAY)):
+        if flag in args:
+            i = args.index(flag)
+            if i + 1 >= len(args):
+                print(f"[FAIL] {flag} needs a cassette path")
+                sys.exit(2)
+            cassette = Cassette(args[i + 1], mode=mode, speed=0 if mode == REPLAY else 1.0)
+            del args[i:i + 2]
+            print(f"[INFO] Using cassette {cassette.path} ({mode} mode)")
+
+    try:
+        if args and args[0] in ['--quick', '-q']:
+            # Quick test mode
+            test_individual_providers()
+        elif args and args[0] == '--probe':
+            # Parallel key validation only
+            test_health_probe()
+        else:
+            # Comprehensive test mode
+            run_comprehensive_test()
+    finally:
+        if cassette is not None:
+            print(f"[INFO] Cassette stats: {cassette.get_stats()}")
+            cassette.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""
+Shared setup for the offline test suite
+"""
+import os
+import sys
+import tempfile
+
+import httpx
+import pytest
+from openai import OpenAI
+
+# Keep log and usage files out of the working tree; settings are read at import time
+_tmp = tempfile.mkdtemp(prefix="cascade-tests-")
+os.environ.setdefault("LOG_FILE", os.path.join(_tmp, "cascade_api.log"))
+os.environ.setdefault("USAGE_TRACKING_FILE", os.path.join(_tmp, "usage_tracking.json"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cascade import CascadingAPIClient
+from providers import ProviderConfig
+from usage_tracker import UsageTracker
+
+def _completion(content: str, completion_tokens: int = 1) -> dict:
+    """Chat completion body generating `completion_tokens` tokens"""
+    return {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "mock-model",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": completion_tokens,
+                  "total_tokens": 3 + completion_tokens},
+    }
+
+@pytest.fixture
+def mock_provider():
+    """Factory for provider configs pointing at an unroutable host"""
+    def make(name: str = "Mock", **overrides) -> ProviderConfig:
+        config = {
+            "name": name,
+            "base_url": f"https://{name.lower()}.invalid/v1",
+            "api_key": "test-key",
+            "model": "mock-model",
+            "daily_limit": 100,
+            "token_limit": 10000,
+        }
+        config.update(overrides)
+        return ProviderConfig(**config)
+    return make
+
+@pytest.fixture
+def chat_handler():
+    """Factory for MockTransport handlers that answer every chat completion"""
+    def make(content: str = "fast", completion_tokens: int = 1):
+        return lambda request: httpx.Response(200, json=_completion(content, completion_tokens))
+    return make
+
+@pytest.fixture
+def completion_json():
+    """Factory for chat completion response bodies"""
+    return _completion
+
+@pytest.fixture
+def mock_client(mock_provider):
+    """
+    Factory for a CascadingAPIClient whose providers all talk to an httpx MockTransport
+
+    Usage is tracked in memory only, so every test starts from zero.
+    """
+    def make(handler, providers=None, **client_options) -> CascadingAPIClient:
+        client = CascadingAPIClient(providers or [mock_provider()], **client_options)
+        client.usage_tracker = UsageTracker(persist=False)
+        for provider in client.providers:
+            client.clients[provider.name] = OpenAI(
+                base_url=provider.base_url,
+                api_key=provider.api_key,
+                max_retries=0,
+                http_client=httpx.Client(transport=httpx.MockTransport(handler))
+            )
+        return client
+    return make
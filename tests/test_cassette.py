@@ -0,0 +1,118 @@
+"""
+Offline tests for cassette record/replay
+"""
+import json
+import time
+
+import httpx
+import pytest
+
+import cassette as cassette_module
+from cascade import CascadingAPIClient
+from cassette import Cassette, CassetteMiss, ReplayTransport, REPLAY_API_KEY
+
+def _write_cassette(path, interactions):
+    lines = [{"type": "meta", "version": 1}]
+    lines.append({"type": "provider", "config": {
+        "name": "Mock", "base_url": "https://mock.invalid/v1", "model": "mock-model",
+        "daily_limit": 100, "token_limit": 10000, "requests_per_minute": 60,
+    }})
+    lines.extend(interactions)
+    path.write_text("\n".join(json.dumps(line) for line in lines) + "\n")
+
+def test_round_trip_replays_recorded_responses(tmp_path, monkeypatch, mock_provider, completion_json):
+    path = tmp_path / "traffic.cassette"
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json=completion_json("recorded answer"),
+                              headers={"x-ratelimit-remaining-requests": "29"})
+
+    monkeypatch.setattr(cassette_module.httpx, "HTTPTransport", lambda: httpx.MockTransport(handler))
+    messages = [{"role": "user", "content": "hello"}]
+
+    with Cassette(path, mode="record") as recorder:
+        client = CascadingAPIClient([mock_provider()], cassette=recorder)
+        assert client.chat_completion(messages) == "recorded answer"
+        assert recorder.get_stats()["recorded"] == 1
+
+    # Any request reaching the network from here on is a replay bug
+    monkeypatch.setattr(cassette_module.httpx, "HTTPTransport", lambda: pytest.fail("network used"))
+
+    with Cassette(path, mode="replay", speed=0) as player:
+        providers = player.providers()
+        assert [p.name for p in providers] == ["Mock"]
+        assert providers[0].api_key == REPLAY_API_KEY
+
+        client = CascadingAPIClient(cassette=player)
+        assert client.chat_completion(messages) == "recorded answer"
+
+        stats = player.get_stats()
+        assert stats["replayed"] == 1
+        assert stats["misses"] == 0
+
+    assert len(calls) == 1
+
+def test_replay_scales_recorded_latency(tmp_path, monkeypatch):
+    path = tmp_path / "latency.cassette"
+    request = httpx.Request("POST", "https://mock.invalid/v1/chat/completions", content=b"{}")
+    _write_cassette(path, [{
+        "type": "interaction", "key": cassette_module.request_key("POST", request.url, b"{}"),
+        "method": "POST", "url": str(request.url), "t": 2.0, "elapsed": 2.0,
+        "status": 200, "headers": [], "body": "{}", "encoding": "utf-8",
+    }])
+
+    sleeps = []
+    monkeypatch.setattr(cassette_module.time, "sleep", sleeps.append)
+
+    player = Cassette(path, mode="replay", speed=10)
+    response = httpx.Client(transport=ReplayTransport(player)).send(request)
+
+    assert response.status_code == 200
+    assert sleeps == [pytest.approx(0.2)]
+    assert player.get_stats()["simulated_latency"] == pytest.approx(0.2)
+
+def test_replay_scales_wait_between_retries(tmp_path):
+    path = tmp_path / "retry.cassette"
+    url = "https://mock.invalid/v1/chat/completions"
+    key = cassette_module.request_key("POST", url, b"{}")
+    # A 429 that finished at t=1.0, retried at t=4.0 (3s gap) and answered at t=4.5
+    _write_cassette(path, [
+        {"type": "interaction", "key": key, "method": "POST", "url": url, "t": 1.0, "elapsed": 0.1,
+         "status": 429, "headers": [["retry-after", "3"]], "body": "{}", "encoding": "utf-8"},
+        {"type": "interaction", "key": key, "method": "POST", "url": url, "t": 4.5, "elapsed": 0.5,
+         "status": 200, "headers": [], "body": "{}", "encoding": "utf-8"},
+    ])
+
+    player = Cassette(path, mode="replay", speed=10)
+    client = httpx.Client(transport=ReplayTransport(player))
+
+    limited = client.post(url, content=b"{}")
+    assert limited.status_code == 429
+    assert "retry-after" not in limited.headers
+    assert float(limited.headers["retry-after-ms"]) == pytest.approx(300.0)
+
+    assert client.post(url, content=b"{}").status_code == 200
+
+def test_replay_miss_raises(tmp_path):
+    path = tmp_path / "empty.cassette"
+    _write_cassette(path, [])
+
+    client = httpx.Client(transport=ReplayTransport(Cassette(path, mode="replay", speed=0)))
+    with pytest.raises(CassetteMiss):
+        client.post("https://mock.invalid/v1/chat/completions", content=b"{}")
+
+def test_replay_miss_surfaces_from_chat_completion(tmp_path):
+    path = tmp_path / "empty.cassette"
+    _write_cassette(path, [])
+
+    with Cassette(path, mode="replay", speed=0) as player:
+        client = CascadingAPIClient(cassette=player)
+        start = time.monotonic()
+        with pytest.raises(CassetteMiss):
+            client.chat_completion([{"role": "user", "content": "never recorded"}])
+
+        # No SDK retries or backoff sleeps before the miss is reported
+        assert time.monotonic() - start < 0.5
+        assert player.get_stats()["misses"] == 1
@@ -0,0 +1,67 @@
+"""
+Offline tests for end-to-end time budgets
+"""
+import time
+
+import pytest
+
+from cascade import DeadlineExceeded
+from scheduler import AdmissionRejected
+
+@pytest.fixture
+def client(mock_client, mock_provider, chat_handler):
+    return mock_client(chat_handler("fast"), [mock_provider("A"), mock_provider("B")])
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+def test_budget_skips_raise_deadline_exceeded_with_attempts(client):
+    for name in ("A", "B"):
+        client.health.observe_latency(name, 1.5, tokens=500)
+
+    with pytest.raises(DeadlineExceeded) as exc_info:
+        client.chat_completion(MESSAGES, timeout=1.0, max_tokens=500, max_retries=0)
+
+    attempts = exc_info.value.attempts
+    assert [(a.provider, a.outcome) for a in attempts] == [("A", "skipped"), ("B", "skipped")]
+    assert "exceeds remaining" in attempts[0].error
+
+def test_slow_estimate_is_retried_after_repeated_skips(client):
+    for name in ("A", "B"):
+        client.health.observe_latency(name, 1.5, tokens=500)
+
+    # Both providers have recovered; within a few calls one is let through and re-sampled
+    results = []
+    for _ in range(client.health.retry_after_skips):
+        try:
+            results.append(client.chat_completion(MESSAGES, timeout=1.0, max_tokens=500, max_retries=0))
+        except DeadlineExceeded:
+            results.append(None)
+
+    assert results[-1] == "fast"
+    assert client.health.latency("A", tokens=500) < 1.5
+
+def test_estimate_scales_with_requested_tokens(client):
+    client.health.observe_latency("A", 1.5, tokens=500)
+
+    # A long generation must not make a short call look too slow
+    assert client.health.latency("A", tokens=10) < 0.1
+    assert client.chat_completion(MESSAGES, timeout=1.0, max_tokens=10, max_retries=0) == "fast"
+
+def test_stale_estimate_is_ignored(client):
+    client.health.max_age = 0.0
+    client.health.observe_latency("A", 1.5, tokens=500)
+
+    assert client.health.latency("A", tokens=500) is None
+    assert client.chat_completion(MESSAGES, timeout=1.0, max_tokens=500, max_retries=0) == "fast"
+
+def test_unadmittable_timeout_raises_deadline_exceeded(mock_client, mock_provider, chat_handler):
+    client = mock_client(chat_handler("fast"), [mock_provider(requests_per_minute=1)])
+    assert client.scheduler.acquire(client.providers[0])
+
+    # The next slot opens in a minute: a 1 s budget fails as a budget, not a scheduling error
+    with pytest.raises(DeadlineExceeded) as exc_info:
+        client.chat_completion(MESSAGES, timeout=1.0)
+    assert exc_info.value.attempts == []
+
+    with pytest.raises(AdmissionRejected):
+        client.chat_completion(MESSAGES, deadline=time.monotonic() + 1.0)
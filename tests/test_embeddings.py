@@ -0,0 +1,118 @@
+"""
+Offline tests for the embeddings cascade
+"""
+import base64
+import json
+
+import httpx
+import numpy as np
+import pytest
+
+from config import settings
+from scheduler import AdmissionScheduler
+
+@pytest.fixture
+def embed_client(mock_client, mock_provider):
+    """Client for a provider that embeds at most two texts per request"""
+    def make(handler):
+        provider = mock_provider(embedding_model="mock-embed", embedding_batch_limit=2)
+        return mock_client(handler, [provider])
+    return make
+
+def _encode(value):
+    return base64.b64encode(np.full(3, value, dtype="<f4").tobytes()).decode("ascii")
+
+def _embedding_response(inputs, indices=None):
+    """Embed each text as a vector filled with its length"""
+    indices = range(len(inputs)) if indices is None else indices
+    return httpx.Response(200, json={
+        "object": "list",
+        "model": "mock-embed",
+        "data": [{"object": "embedding", "index": i, "embedding": _encode(float(len(text)))}
+                 for i, text in zip(indices, inputs)],
+        "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+    })
+
+def test_embed_deduplicates_and_keeps_input_order(embed_client):
+    sent = []
+
+    def handler(request):
+        inputs = json.loads(request.content)["input"]
+        sent.extend(inputs)
+        return _embedding_response(inputs)
+
+    texts = ["a", "bbb", "a", "cc", "bbb"]
+    vectors = embed_client(handler).embed(texts, max_retries=0)
+
+    assert sorted(sent) == ["a", "bbb", "cc"]
+    assert vectors.dtype == np.float32
+    assert vectors.flags["C_CONTIGUOUS"]
+    assert vectors[:, 0].tolist() == [1.0, 3.0, 1.0, 2.0, 3.0]
+
+def test_embed_rejects_duplicate_indices(embed_client):
+    def handler(request):
+        inputs = json.loads(request.content)["input"]
+        return _embedding_response(inputs, indices=[0] * len(inputs))
+
+    with pytest.raises(Exception, match="embedding providers failed"):
+        embed_client(handler).embed(["a", "bb"], max_retries=0)
+
+def test_batches_respect_per_request_token_limit(mock_client, mock_provider):
+    # token_limit is a per-minute budget and must not decide the request size
+    provider = mock_provider(token_limit=10, embedding_model="mock-embed", embedding_token_limit=30)
+    client = mock_client(lambda request: None, [provider])
+    texts = ["x" * 40] * 5  # 11 estimated tokens each
+
+    batches = client._make_batches(provider, texts, list(range(5)), batch_size=64)
+    assert batches == [[0, 1], [2, 3], [4]]
+
+def test_concurrent_batches_stop_at_daily_limit(embed_client):
+    sent = []
+
+    def handler(request):
+        inputs = json.loads(request.content)["input"]
+        sent.append(inputs)
+        return _embedding_response(inputs)
+
+    client = embed_client(handler)
+    client.providers[0].daily_limit = 3
+
+    with pytest.raises(Exception, match="embedding providers failed"):
+        client.embed([f"text {i}" for i in range(12)], max_retries=0)
+
+    assert len(sent) == 3
+    assert client.get_usage_stats()["Mock"]["requests_used"] == 3
+
+def test_batches_beyond_rate_limit_wait_for_slots(mock_client, mock_provider, monkeypatch):
+    monkeypatch.setattr(settings, "INTERACTIVE_MAX_WAIT", 0.05)
+    sent = []
+
+    def handler(request):
+        inputs = json.loads(request.content)["input"]
+        sent.append(inputs)
+        return _embedding_response(inputs)
+
+    provider = mock_provider(requests_per_minute=5, embedding_model="mock-embed", embedding_batch_limit=2)
+    client = mock_client(handler, [provider])
+    # A 0.3 s rate window, far longer than the interactive max wait
+    client.scheduler = AdmissionScheduler(client.providers, time_scale=0.005)
+
+    texts = [f"text {i:02d}" for i in range(20)]
+    vectors = client.embed(texts, max_retries=0)
+
+    # Ten batches against five slots per window: the rest queue rather than fail over
+    assert len(sent) == 10
+    assert vectors.shape == (20, 3)
+    assert client.get_scheduler_stats()["classes"]["interactive"]["rejected"] == 0
+
+def test_embed_tries_down_embedding_providers_when_all_are_down(mock_client, mock_provider):
+    def handler(request):
+        return _embedding_response(json.loads(request.content)["input"])
+
+    chat_only = mock_provider("Chat")
+    embedder = mock_provider("Embedder", embedding_model="mock-embed")
+    client = mock_client(handler, [chat_only, embedder])
+    client.health.mark_down("Embedder", "test")
+
+    # A healthy chat-only provider must not hide the fallback to the down embedder
+    assert client.embed(["abc"], max_retries=0)[:, 0].tolist() == [3.0]
@@ -0,0 +1,102 @@
+"""
+Offline tests for health probe classification and accounting
+"""
+import httpx
+import pytest
+
+from prober import HealthProber, PROBE_COMPLETION, PROBE_MODELS
+from scheduler import PRIORITY_BULK
+
+@pytest.fixture
+def probe_client(mock_client, completion_json):
+    """Client whose provider answers every request with `status`"""
+    def make(status):
+        def handler(request):
+            if status != 200:
+                return httpx.Response(status, json={"error": {"message": f"status {status}"}})
+            if request.url.path.endswith("/models"):
+                return httpx.Response(200, json={"object": "list", "data": []})
+            return httpx.Response(200, json=completion_json("p"))
+        return mock_client(handler)
+    return make
+
+@pytest.mark.parametrize("method, status, healthy", [
+    (PROBE_MODELS, 200, True),
+    (PROBE_MODELS, 429, True),
+    (PROBE_MODELS, 404, True),
+    (PROBE_MODELS, 400, False),
+    (PROBE_MODELS, 401, False),
+    (PROBE_MODELS, 503, False),
+    (PROBE_COMPLETION, 200, True),
+    (PROBE_COMPLETION, 429, True),
+    (PROBE_COMPLETION, 404, False),
+    (PROBE_COMPLETION, 400, False),
+    (PROBE_COMPLETION, 403, False),
+])
+def test_probe_status_classification(method, status, healthy, probe_client):
+    client = probe_client(status)
+    prober = HealthProber(client, method=method, interval=3600, daily_budget=24)
+
+    assert prober.probe(client.providers[0]) is healthy
+    assert client.health.is_available("Mock") is healthy
+
+def test_completion_probe_cost_is_reported(probe_client):
+    client = probe_client(200)
+    prober = HealthProber(client, method=PROBE_COMPLETION, interval=3600, daily_budget=24)
+    prober.validate_all()
+
+    stats = prober.get_stats()["Mock"]
+    assert stats["probes_total"] == 1
+    assert stats["quota_requests"] == 1
+    assert stats["quota_tokens"] == 4
+    assert client.get_usage_stats()["Mock"]["requests_used"] == 1
+
+def test_probes_stay_out_of_scheduler_stats(probe_client):
+    client = probe_client(200)
+    prober = HealthProber(client, interval=3600, daily_budget=24)
+    prober.validate_all()
+    prober.validate_all()
+
+    stats = client.get_scheduler_stats()
+    assert stats["classes"][PRIORITY_BULK]["admitted"] == 0
+    assert stats["classes"][PRIORITY_BULK]["timed_out"] == 0
+    # The probes still used real request slots
+    assert stats["providers"]["Mock"]["requests_in_window"] == 2
+
+def test_exhausted_budget_releases_down_provider(probe_client):
+    client = probe_client(401)
+    prober = HealthProber(client, interval=86400, daily_budget=1)
+    provider = client.providers[0]
+
+    assert prober.probe(provider) is False
+    assert not client.health.is_available("Mock")
+
+    # No probes left today: live traffic gets to decide again
+    assert prober.probe(provider) is None
+    assert client.health.is_available("Mock")
+
+def test_live_key_rejection_without_prober_keeps_provider(probe_client):
+    client = probe_client(401)
+
+    with pytest.raises(Exception, match="providers failed"):
+        client.chat_completion([{"role": "user", "content": "hi"}], max_retries=0)
+
+    # Nothing would ever mark it up again, so a live rejection alone must not take it out
+    assert client.health.is_available("Mock")
+
+def test_stopping_prober_releases_down_providers(probe_client):
+    client = probe_client(401)
+    client.start_health_prober(interval=3600, daily_budget=24)
+    assert not client.health.is_available("Mock")
+
+    client.stop_health_prober()
+    assert client.health.is_available("Mock")
+
+def test_completion_probe_stays_out_of_latency_estimate(probe_client):
+    client = probe_client(200)
+    HealthProber(client, method=PROBE_COMPLETION, interval=3600, daily_budget=24).validate_all()
+
+    stats = client.get_health_stats()["Mock"]
+    assert stats["probe_latency"] is not None
+    assert stats["latency"] is None
+    assert client.health.latency("Mock", tokens=500) is None
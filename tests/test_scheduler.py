@@ -0,0 +1,51 @@
+"""
+Offline tests for the admission scheduler
+"""
+import time
+
+from scheduler import AdmissionScheduler, PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+def test_bulk_leaves_reserved_capacity_for_interactive(mock_provider):
+    provider = mock_provider(requests_per_minute=5)
+    scheduler = AdmissionScheduler([provider], interactive_reserve=0.2)
+
+    bulk = [scheduler.acquire(provider, PRIORITY_BULK, max_wait=0) for _ in range(5)]
+    assert bulk == [True, True, True, True, False]
+
+    # The reserved slot is still there for interactive traffic, and nothing beyond it
+    assert scheduler.acquire(provider, PRIORITY_INTERACTIVE, max_wait=0)
+    assert not scheduler.acquire(provider, PRIORITY_INTERACTIVE, max_wait=0)
+
+    stats = scheduler.get_stats()
+    assert stats["providers"]["Mock"]["bulk_capacity"] == 4
+    assert stats["providers"]["Mock"]["requests_in_window"] == 5
+    assert stats["classes"][PRIORITY_BULK]["admitted"] == 4
+    assert stats["classes"][PRIORITY_BULK]["rejected"] == 1
+    assert stats["classes"][PRIORITY_INTERACTIVE]["admitted"] == 1
+
+def test_unmeetable_deadline_is_rejected_without_waiting(mock_provider):
+    provider = mock_provider(requests_per_minute=1)
+    scheduler = AdmissionScheduler([provider])
+    assert scheduler.acquire(provider, PRIORITY_INTERACTIVE)
+
+    # The next slot opens in a minute; a one-second deadline must fail immediately
+    start = time.monotonic()
+    assert not scheduler.acquire(provider, PRIORITY_INTERACTIVE, deadline=start + 1.0)
+    assert time.monotonic() - start < 0.5
+
+    assert scheduler.earliest_start([provider]) > start + 1.0
+    assert scheduler.get_stats()["classes"][PRIORITY_INTERACTIVE]["rejected"] == 1
+
+def test_time_scale_shrinks_the_rate_window(mock_provider):
+    provider = mock_provider(requests_per_minute=1)
+    scheduler = AdmissionScheduler([provider], time_scale=0.001)
+
+    assert scheduler.acquire(provider, PRIORITY_INTERACTIVE)
+    # A 60 ms window at this scale: the second request waits briefly instead of a minute
+    assert scheduler.acquire(provider, PRIORITY_INTERACTIVE, max_wait=1.0)
+
+def test_zero_time_scale_disables_rate_limiting(mock_provider):
+    provider = mock_provider(requests_per_minute=1)
+    scheduler = AdmissionScheduler([provider], time_scale=0)
+
+    assert all(scheduler.acquire(provider, PRIORITY_BULK, max_wait=0) for _ in range(10))
@@ -3,6 +3,7 @@ Usage tracking functionality for API providers
 """
 import json
 import logging
+import threading
 from datetime import datetime
 from pathlib import Path
 from typing import Dict
@@ -14,9 +15,11 @@ logger = logging.getLogger(__name__)
 class UsageTracker:
     """Track API usage across providers"""
 
-    def __init__(self, usage_file: str = None):
+    def __init__(self, usage_file: str = None, persist: bool = True):
         self.usage_file = Path(usage_file or settings.USAGE_TRACKING_FILE)
-        self.usage_data = self._load_usage()
+        self.persist = persist
+        self._lock = threading.RLock()
+        self.usage_data = self._load_usage() if persist else {}
 
     def _load_usage(self) -> Dict:
         """Load usage data from file"""
@@ -40,6 +43,8 @@ class UsageTracker:
 
     def _save_usage(self):
         """Save usage data to file"""
+        if not self.persist:
+            return
         try:
             with open(self.usage_file, 'w') as f:
                 json.dump(self.usage_data, f, indent=2)
@@ -49,38 +54,59 @@ class UsageTracker:
     def get_usage(self, provider_name: str) -> Dict:
         """Get current usage for a provider"""
         current_date = datetime.now().strftime('%Y-%m-%d')
-        if provider_name not in self.usage_data:
-            self.usage_data[provider_name] = {
-                'date': current_date, 
-                'requests': 0, 
-                'tokens': 0
-            }
-        return self.usage_data[provider_name]
+        with self._lock:
+            if provider_name not in self.usage_data:
+                self.usage_data[provider_name] = {
+                    'date': current_date, 
+                    'requests': 0, 
+                    'tokens': 0
+                }
+            return self.usage_data[provider_name]
 
     def update_usage(self, provider_name: str, requests: int = 0, tokens: int = 0):
         """Update usage for a provider"""
-        usage = self.get_usage(provider_name)
-        usage['requests'] += requests
-        usage['tokens'] += tokens
-        self._save_usage()
+        with self._lock:
+            usage = self.get_usage(provider_name)
+            usage['requests'] += requests
+            usage['tokens'] += tokens
+            self._save_usage()
         logger.debug(f"Updated usage for {provider_name}: +{requests} requests, +{tokens} tokens")
 
     def check_limits(self, provider) -> bool:
         """Check if provider has exceeded limits"""
-        usage = self.get_usage(provider.name)
+        with self._lock:
+            usage = self.get_usage(provider.name)
+            requests, tokens = usage['requests'], usage['tokens']
 
-        if usage['requests'] >= provider.daily_limit:
-            logger.warning(f"{provider.name} has exceeded daily request limit ({usage['requests']}/{provider.daily_limit})")
+        if requests >= provider.daily_limit:
+            logger.warning(f"{provider.name} has exceeded daily request limit ({requests}/{provider.daily_limit})")
             return False
 
         # Rough daily token limit check (token_limit is typically per minute)
         daily_token_limit = provider.token_limit * 1440  # minutes in a day
-        if usage['tokens'] >= daily_token_limit:
+        if tokens >= daily_token_limit:
             logger.warning(f"{provider.name} has exceeded estimated daily token limit")
             return False
 
         return True
 
+    def reserve_request(self, provider) -> bool:
+        """
+        Check limits and count a request in one step, so concurrent requests cannot overrun them
+
+        Returns:
+            True if the request was counted, False if the provider is over its limits
+        """
+        with self._lock:
+            if not self.check_limits(provider):
+                return False
+            self.update_usage(provider.name, requests=1)
+            return True
+
+    def release_request(self, provider_name: str):
+        """Return a reserved request that did not succeed"""
+        self.update_usage(provider_name, requests=-1)
+
     def get_usage_stats(self, providers) -> Dict:
         """Get usage statistics for all providers"""
         stats = {}
@@ -20,12 +20,12 @@ def setup_logging():
         ]
     )
 
-def exponential_backoff(retry_count: int, max_delay: int = None) -> None:
-    """Implement exponential backoff"""
+def exponential_backoff(retry_count: int, max_delay: int = None, scale: float = 1.0) -> None:
+    """Implement exponential backoff; scale shortens or lengthens the delay (e.g. for replays)"""
     if max_delay is None:
         max_delay = settings.MAX_BACKOFF_DELAY
 
-    delay = min(settings.BASE_BACKOFF_DELAY ** retry_count, max_delay)
+    delay = min(settings.BASE_BACKOFF_DELAY ** retry_count * scale, max_delay)
     logger.info(f"Waiting {delay} seconds before retry...")
     time.sleep(delay)
 
@@ -41,6 +41,10 @@ def adapt_request_params(provider_name: str, params: Dict[str, Any]) -> Dict[str
 
     return params
 
+def estimate_tokens(text: str) -> int:
+    """Rough token count for batching (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
 def format_usage_display(stats: Dict) -> str:
     """Format usage statistics for display"""
     lines = ["📊 Usage Statistics:"]